@@ -0,0 +1,137 @@
+"""
+asyncio API for embedding discoship in an event loop
+
+The rest of discoship blocks: HTTP goes through requests & the db through
+sqlite3.  The coroutines here run that blocking work on two dedicated,
+bounded thread pools so the event loop never waits on it:
+
+  * DB_WORKERS threads for sqlite3 reads & ingest writes (writes are still
+    serialized through discoship.db's DBWriter)
+  * HTTP_WORKERS threads for HTTP requests & parsing of fetched HTML
+
+Cancellation: a cancelled coroutine raises CancelledError at once.  A step
+that has not started yet is never run; a step already running in a worker
+thread cannot be interrupted & completes in the background.  Each ingest
+writes its data in a single step, so cancelling ingest() never leaves
+ingested rows without their last_ingest_* date, & cancelling while still
+fetching writes nothing at all.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import logging
+
+from discoship.defs import DEFAULT_SERVICE, USPS_SVC_FCPIS
+from discoship.io import requests_session
+from discoship import pricing, profiles
+
+
+log = logging.getLogger(__name__)
+
+
+DB_WORKERS = 4
+HTTP_WORKERS = 8
+# seconds to wait on connect & on each read of an HTTP response
+HTTP_TIMEOUT = 30
+
+
+@functools.cache
+def db_executor():
+    """returns the thread pool running blocking sqlite3 work"""
+    return ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="discoship-aio-db")
+
+
+@functools.cache
+def http_executor():
+    """returns the thread pool running blocking HTTP requests & parsing"""
+    return ThreadPoolExecutor(max_workers=HTTP_WORKERS, thread_name_prefix="discoship-aio-http")
+
+
+async def run_in(executor, func, *args, **kwargs):
+    """awaits func(*args, **kwargs) run in executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+def _get(url, headers):
+    sess = requests_session(**headers)
+    with sess:
+        response = sess.get(url, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        return response.text
+
+
+async def fetch(url, **headers):
+    """fetches url & returns contents
+
+    unlike discoship.io.fetch_url() responses are not cached, & HTTP error
+    statuses raise requests.HTTPError"""
+    log.debug(f"aio.fetch: {url}")
+    return await run_in(http_executor(), _get, url, headers)
+
+
+async def _ingest_usps(fetchall=False, cpg=False, rates=False, service=DEFAULT_SERVICE):
+    # deferred like cli's ingest: bs4 is only needed once ingesting
+    from discoship.usps import cpg as usps_cpg
+    from discoship.usps import rates as usps_rates
+
+    # CPG & rate tables are both on the Notice 123 page, fetch it only once
+    urls = set()
+    if fetchall or cpg:
+        urls.add(usps_cpg.CPG_DATA_URL)
+    if fetchall or rates:
+        urls.add(usps_rates.RATE_TABLE_URL)
+    urls = sorted(urls)
+    pages = dict(zip(urls, await asyncio.gather(*(fetch(url) for url in urls))))
+
+    if fetchall or cpg:
+        cpg_data = await run_in(http_executor(), usps_cpg.parse_cpg_data,
+                                pages[usps_cpg.CPG_DATA_URL], service=service)
+        await run_in(db_executor(), usps_cpg.ingest_cpg_data, cpg_data, service=service)
+    if fetchall or rates:
+        rates_data = await run_in(http_executor(), usps_rates.parse_fcpis_rates_data,
+                                  pages[usps_rates.RATE_TABLE_URL])
+        await run_in(db_executor(), usps_rates.ingest_fcpis_rates_data, rates_data)
+
+
+async def _ingest_discogs(source=None):
+    from discoship.discogs import fetch as discogs
+    if source is None:
+        source = discogs.SHIP_DESTS_PATH
+    destinations = await run_in(http_executor(), discogs.parse_destinations, source)
+    await run_in(db_executor(), discogs.ingest_destinations, destinations)
+
+
+async def ingest(provider, **kwargs):
+    """fetches & ingests data of provider ("usps" or "discogs")
+
+    kwargs are those of the provider's sync fetch(), e.g.:
+    ```
+    await ingest("usps", fetchall=True)
+    await ingest("discogs", source="shipping-destinations.htm")
+    ```"""
+    provider = provider.lower()
+    if provider == "usps":
+        await _ingest_usps(**kwargs)
+    elif provider == "discogs":
+        await _ingest_discogs(**kwargs)
+    else:
+        raise ValueError(f"Unknown provider {provider!r}, expected usps or discogs")
+
+
+def _quote(country, weight_oz, service, profile):
+    rules = ()
+    if profile:
+        rules = profiles.get_rules(profile)
+    return pricing.quote(country, weight_oz, service=service, rules=rules)
+
+
+async def quote(country, weight_oz, service=USPS_SVC_FCPIS, profile=None):
+    """prices one package of weight_oz to country, with pricing rules of
+    seller profile applied if given
+
+    raises ValueError for unknown countries & profiles, & invalid package
+    weights
+
+    returns price"""
+    return await run_in(db_executor(), _quote, country, weight_oz, service, profile)
@@ -1,10 +1,14 @@
 import argparse
 import importlib
 import logging
+import os
 from pprint import pprint
 
-from discoship.db import dbinit, dump_config, reset_config, recreate_ingest_tables
-from discoship.defs import DEFAULT_PROVIDER, DEFAULT_SERVICE, VERSION
+from discoship.db import create_profile_tables, dbinit, dump_config, reset_config, recreate_ingest_tables
+from discoship.defs import DEFAULT_PROVIDER, DEFAULT_SERVICE, USPS_SERVICES, VERSION
+from discoship.export import DEFAULT_PROFILE, EXPORT_FORMATS, export_policies
+from discoship.pricing import format_diff, load_rules, read_rules, reprice
+from discoship import profiles
 
 
 log = logging.getLogger(__name__)
@@ -48,6 +52,8 @@ InitArgParser.add_argument('--db', action='store_true',
                            help='recreate entire db from scratch [WARNING: DESTROYS ALL DATA]')
 InitArgParser.add_argument('--reset-ingest-tables', action='store_true',
                            help='drop & recreate ingest tables; you will have to re-run ingest commands')
+InitArgParser.add_argument('--profiles', action='store_true',
+                           help='create seller profile tables if missing')
 InitArgParser.add_argument('--api', action='store_true',
                            help='configure access to discogs.com API')
 
@@ -56,6 +62,53 @@ ConfigArgParser.add_argument('--dump', action='store_true',
                              help='display current config')
 ConfigArgParser.add_argument('--reset', action='store_true',
                              help='reset config to defaults')
+ConfigArgParser.add_argument('--profile',
+                             help='with --dump, display config as seen by seller profile')
+
+ProfileArgParser = actions.add_parser('profile', help='manage seller profiles')
+ProfileArgParser.add_argument('name', nargs='?',
+                              help='seller profile name')
+ProfileArgParser.add_argument('--list', action='store_true',
+                              help='list seller profiles')
+ProfileArgParser.add_argument('--create', action='store_true',
+                              help='create profile')
+ProfileArgParser.add_argument('--delete', action='store_true',
+                              help='delete profile with its config & policies')
+ProfileArgParser.add_argument('--set', nargs=2, metavar=('KEY', 'VALUE'),
+                              help='override config KEY for profile')
+ProfileArgParser.add_argument('--unset', metavar='KEY',
+                              help='remove profile override of config KEY')
+ProfileArgParser.add_argument('--rules', metavar='RULES_JSON',
+                              help='store pricing rules file for profile')
+ProfileArgParser.add_argument('--generate', action='store_true',
+                              help='generate policies for profile (all profiles if no name given)')
+ProfileArgParser.add_argument('--dump', action='store_true',
+                              help="display profile's config & generated policy")
+
+RepriceArgParser = actions.add_parser('reprice', help='model pricing rules on top of current rates')
+RepriceArgParser.add_argument('rules', metavar='RULES_JSON',
+                              help='JSON file containing list of pricing rules')
+RepriceArgParser.add_argument('--policy', action='store_true',
+                              help='display full repriced policy, not only the diff')
+
+ExportArgParser = actions.add_parser('export', help='export shipping policies to CSV/JSON')
+ExportArgParser.add_argument('--outdir', default='.',
+                             help='directory to write exports to (default .)')
+ExportArgParser.add_argument('--service', action='append', choices=USPS_SERVICES,
+                             help='Shipping service, may be repeated (default all)')
+ExportArgParser.add_argument('--rules', action='append', metavar='RULES_JSON',
+                             help='pricing rules file, one profile per file named '
+                                  f'after it, may be repeated (default {DEFAULT_PROFILE}: unmodified rates)')
+ExportArgParser.add_argument('--profile', action='append',
+                             help='seller profile to export, may be repeated')
+ExportArgParser.add_argument('--all-profiles', action='store_true',
+                             help='export every seller profile')
+ExportArgParser.add_argument('--format', action='append', choices=EXPORT_FORMATS,
+                             help='output format, may be repeated (default csv)')
+ExportArgParser.add_argument('--jobs', type=int, default=None,
+                             help='number of parallel export processes (default cpu count)')
+ExportArgParser.add_argument('--force', action='store_true',
+                             help='rewrite exports even if source data is unchanged')
 
 
 def func_importer(func_path):
@@ -76,12 +129,38 @@ def delegate_args(args):
             pprint(dump_config())
             reset_config()
         elif args.dump:
-            pprint(dump_config())
+            if args.profile and not profiles.profile_exists(args.profile):
+                ConfigArgParser.error(f'unknown profile: {args.profile}')
+            pprint(profiles.get_config(args.profile) if args.profile else dump_config())
     elif args.action == 'init':
         if args.db:
             dbinit()
         elif args.reset_ingest_tables:
             recreate_ingest_tables()
+        elif args.profiles:
+            create_profile_tables()
+    elif args.action == 'profile':
+        if args.name and not args.create and not profiles.profile_exists(args.name):
+            ProfileArgParser.error(f'unknown profile: {args.name}')
+        if args.list:
+            print("\n".join(profiles.list_profiles()))
+        elif args.generate:
+            pprint(profiles.generate_policies([args.name] if args.name else None))
+        elif not args.name:
+            ProfileArgParser.error('profile name required')
+        elif args.create:
+            profiles.create_profile(args.name)
+        elif args.delete:
+            profiles.delete_profile(args.name)
+        elif args.set:
+            profiles.set_config(args.name, *args.set)
+        elif args.unset:
+            profiles.unset_config(args.name, args.unset)
+        elif args.rules:
+            profiles.set_rules(args.name, read_rules(args.rules))
+        elif args.dump:
+            pprint(profiles.get_config(args.name))
+            pprint(profiles.dump_policy(args.name))
     elif args.action == 'ingest':
         func_path = f'discoship.{args.provider.lower()}.fetch.fetch'
         func = func_importer(func_path)
@@ -89,4 +168,30 @@ def delegate_args(args):
             func()
         elif args.provider == 'usps':
             func(fetchall=args.all, cpg=args.cpg, rates=args.rates, service=args.service)
+    elif args.action == 'reprice':
+        policy, diff = reprice(load_rules(args.rules))
+        if args.policy:
+            pprint(policy)
+        print(format_diff(diff))
+    elif args.action == 'export':
+        names = profiles.list_profiles() if args.all_profiles else args.profile or []
+        unknown = set(names).difference(profiles.list_profiles())
+        if unknown:
+            ExportArgParser.error(f'unknown profiles: {", ".join(sorted(unknown))}')
+        export_profiles = { name: profiles.get_rules(name) for name in names }
+        for path in args.rules or []:
+            name = os.path.splitext(os.path.basename(path))[0]
+            if name in export_profiles:
+                ExportArgParser.error(f'duplicate profile name {name!r} from --rules {path}')
+            export_profiles[name] = read_rules(path)
+        if not export_profiles:
+            export_profiles = { DEFAULT_PROFILE: [] }
+        results = export_policies(args.outdir,
+                                  services=args.service or USPS_SERVICES,
+                                  profiles=export_profiles,
+                                  formats=args.format or ['csv'],
+                                  force=args.force,
+                                  jobs=args.jobs)
+        for path, rowcount in results:
+            print(f"{path}: {'unchanged' if rowcount is None else f'{rowcount} rows'}")
 
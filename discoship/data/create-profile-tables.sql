@@ -0,0 +1,29 @@
+/*
+Seller profiles: many shops managed from one db, sharing the ingested
+USPS/Discogs tables.  These tables hold user data, so they are only created
+if missing; dbinit() drops them explicitly before recreating.
+*/
+
+CREATE TABLE IF NOT EXISTS profile(
+    name VARCHAR NOT NULL,
+    created TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (name)
+);
+
+-- per-profile overrides of the global config table, same kvs layout
+CREATE TABLE IF NOT EXISTS profile_config(
+    profile VARCHAR NOT NULL REFERENCES profile(name) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value,
+    PRIMARY KEY (profile, name)
+) WITHOUT ROWID;
+
+-- generated policy prices, see discoship.profiles.generate_policies()
+CREATE TABLE IF NOT EXISTS profile_policy(
+    profile VARCHAR NOT NULL REFERENCES profile(name) ON DELETE CASCADE,
+    country_name VARCHAR NOT NULL,
+    usps_service_code VARCHAR NOT NULL,
+    band VARCHAR NOT NULL,
+    price REAL NOT NULL,
+    PRIMARY KEY (profile, country_name, usps_service_code, band)
+) WITHOUT ROWID;
@@ -1,12 +1,71 @@
+import atexit
+from collections import Counter
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from contextlib import contextmanager
 import logging
+import os
+import queue
 import sqlite3
+import threading
+import time
 
-from discoship.defs import DB_PATH, SQL_INGEST_PATH, SQL_DISCOGS_PATH, SQL_CONFIG_PATH
+from discoship.defs import DB_PATH, SQL_INGEST_PATH, SQL_DISCOGS_PATH, SQL_CONFIG_PATH, SQL_PROFILE_PATH
 
 
 log = logging.getLogger(__name__)
 
+# seconds sqlite3 will wait on a lock held by another connection/process
+# before raising "database is locked"
+BUSY_TIMEOUT = 30.0
+# max number of queued write requests folded into one group commit
+WRITE_BATCH_MAX = 256
+# times a group commit failing with SQLITE_BUSY is retried, & base delay (s)
+BUSY_RETRIES = 5
+BUSY_RETRY_DELAY = 0.05
+# seconds between liveness checks of the writer thread by waiting callers
+WRITER_CHECK_INTERVAL = 1.0
+# rows per fetchmany() when streaming results from iterselect()
+ITER_BATCH_SIZE = 500
+
+
+# {table: number of transactions committed by this process writing to table};
+# lets caches of table contents tell whether they are stale, see table_version()
+_table_versions = Counter()
+_table_versions_lock = threading.Lock()
+
+WRITE_ACTIONS = (
+    sqlite3.SQLITE_INSERT,
+    sqlite3.SQLITE_UPDATE,
+    sqlite3.SQLITE_DELETE,
+    sqlite3.SQLITE_CREATE_TABLE,
+    sqlite3.SQLITE_DROP_TABLE,
+)
+
+
+def table_version(table):
+    """returns counter bumped each time this process commits a write to table
+
+    writes by other processes are not counted"""
+    with _table_versions_lock:
+        return _table_versions[table]
+
+
+def _track_writes(conn, tables):
+    """records names of tables written to by statements conn prepares in set tables
+
+    the authorizer only runs when a statement is prepared, so conn must not
+    reuse cached statements (cached_statements=0) for this to see every write"""
+    def authorizer(action, arg1, arg2, dbname, source):
+        if action in WRITE_ACTIONS:
+            tables.add(arg1)
+        return sqlite3.SQLITE_OK
+    conn.set_authorizer(authorizer)
+
+
+def _bump_table_versions(tables):
+    with _table_versions_lock:
+        _table_versions.update(tables)
+
 
 @contextmanager
 def dbopen(readonly=False, row_factory=None, **connect_kwargs):
@@ -21,12 +80,16 @@ def dbopen(readonly=False, row_factory=None, **connect_kwargs):
     log.info(f"dbopen: ro={readonly} row_factory={row_factory} connect_kwargs={connect_kwargs}")
     # https://www.sqlite.org/uri.html
     connect_kwargs["uri"] = True
+    connect_kwargs.setdefault("timeout", BUSY_TIMEOUT)
     if readonly:
         db_path = f"file:{DB_PATH}?mode=ro&cache=shared"
     else:
         db_path = f"file:{DB_PATH}?mode=rwc&cache=shared"
     log.debug(f"dbopen: db_path={db_path}")
     conn = sqlite3.connect(db_path, **connect_kwargs)
+    written = set()
+    if not readonly:
+        _track_writes(conn, written)
 
     # for SELECT statements, allow setting row_factory to sqlite3.Row
     # "Row provides indexed and case-insensitive named access to columns, with
@@ -43,10 +106,214 @@ def dbopen(readonly=False, row_factory=None, **connect_kwargs):
         raise e
     else:
         conn.commit()
+        _bump_table_versions(written)
     finally:
         conn.close()
 
 
+class DBWriter:
+    """single writer thread serializing writes for this process
+
+    execute(), executemany() & executeall() callers enqueue their statements
+    and block on a Future while the writer thread drains the queue, applying
+    up to WRITE_BATCH_MAX queued requests inside one BEGIN IMMEDIATE
+    transaction (a "group commit").  Each request runs under its own
+    SAVEPOINT so a failing request is rolled back & raised to its caller
+    alone without spoiling the rest of the batch.
+
+    The db is switched to WAL journaling so readers (select/selectone) run
+    concurrently with the writer; other processes doing the same contend
+    only on the write lock, waiting up to BUSY_TIMEOUT for it.  WAL mode is
+    persistent: after the first write the db file stays in WAL mode & is
+    accompanied by -wal & -shm files while in use."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="discoship-dbwriter",
+                                       daemon=True)
+        self.thread.start()
+
+    def submit(self, statements):
+        """enqueue a write request of statements, a list of (sql, params, many)
+        applied atomically
+
+        returns concurrent.futures.Future of list of rowcounts"""
+        future = Future()
+        self.queue.put((statements, future))
+        return future
+
+    def stop(self):
+        """flush pending writes & wait for writer thread to exit"""
+        self.queue.put(None)
+        self.thread.join()
+
+    def _connect(self):
+        # isolation_level=None: transactions are managed explicitly below
+        conn = sqlite3.connect(f"file:{DB_PATH}?mode=rwc", uri=True,
+                               timeout=BUSY_TIMEOUT, isolation_level=None,
+                               check_same_thread=False, cached_statements=0)
+        self.written = set()
+        _track_writes(conn, self.written)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # durable across application crashes; safe w/WAL & much cheaper commits
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # profile tables cascade deletes from profile
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def _next_batch(self):
+        """blocks for first request, then drains whatever else is queued
+
+        returns (batch, stopping)"""
+        item = self.queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        while len(batch) < WRITE_BATCH_MAX:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _commit_batch(self, conn, batch):
+        """applies batch in one transaction, resolving each request's future
+
+        raises if the transaction as a whole fails; futures are then left to
+        the caller to resolve"""
+        cur = conn.cursor()
+        results = []
+        try:
+            # IMMEDIATE takes the write lock up front, so busy timeout applies
+            # rather than failing on a read->write lock upgrade
+            self.written.clear()
+            cur.execute("BEGIN IMMEDIATE")
+            for statements, future in batch:
+                cur.execute("SAVEPOINT discoship_write")
+                rowcounts = []
+                try:
+                    for sql, params, many in statements:
+                        if many:
+                            cur.executemany(sql, params)
+                        else:
+                            cur.execute(sql, params)
+                        rowcounts.append(cur.rowcount)
+                except Exception as e:
+                    cur.execute("ROLLBACK TO discoship_write")
+                    results.append((future, None, e))
+                else:
+                    results.append((future, rowcounts, None))
+                cur.execute("RELEASE discoship_write")
+            cur.execute("COMMIT")
+            _bump_table_versions(self.written)
+        except Exception:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except Exception as e:
+                log.error(f"DBWriter: rollback failed: {e}")
+            raise
+        log.debug(f"DBWriter: committed {len(batch)} writes")
+        for future, rowcounts, exc in results:
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(rowcounts)
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _run(self):
+        conn = None
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if not batch:
+                continue
+            try:
+                for attempt in range(BUSY_RETRIES + 1):
+                    try:
+                        if conn is None:
+                            conn = self._connect()
+                        self._commit_batch(conn, batch)
+                        break
+                    except sqlite3.OperationalError as e:
+                        # sqlite skips the busy handler in some cases, e.g.
+                        # racing another process switching the db to WAL;
+                        # nothing was committed, so the batch can be retried
+                        busy = getattr(e, "sqlite_errorcode", 0) & 0xff == sqlite3.SQLITE_BUSY
+                        if not busy or attempt == BUSY_RETRIES:
+                            raise
+                        log.warning(f"DBWriter: db busy, retrying group commit of {len(batch)} writes: {e}")
+                        if conn is not None:
+                            self._close(conn)
+                            conn = None
+                        time.sleep(BUSY_RETRY_DELAY * (attempt + 1))
+            except BaseException as e:
+                log.error(f"DBWriter: group commit of {len(batch)} writes failed: {e}")
+                for statements, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                # connection state is unknown after a failed commit, start over
+                if conn is not None:
+                    self._close(conn)
+                    conn = None
+                if not isinstance(e, Exception):
+                    raise
+        if conn is not None:
+            conn.close()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """returns this process' DBWriter, starting it on first use
+
+    a forked child inherits the parent's DBWriter object but not its thread,
+    so a writer is (re)started whenever the pid changes, or if its thread has
+    died; requests left queued to a dead writer are resubmitted by _write()"""
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer.pid != os.getpid():
+            _writer = DBWriter()
+        elif not _writer.thread.is_alive():
+            log.warning("DBWriter: writer thread died, restarting")
+            _writer = DBWriter()
+        return _writer
+
+
+def _write(statements):
+    """submits write request to this process' DBWriter & waits for its rowcounts
+
+    while waiting, periodically checks the writer the request was submitted
+    to is still alive; if it died without resolving the request, the request
+    never ran & is resubmitted to a fresh writer instead of hanging"""
+    writer = get_writer()
+    future = writer.submit(statements)
+    while True:
+        try:
+            return future.result(timeout=WRITER_CHECK_INTERVAL)
+        except FutureTimeoutError:
+            if not writer.thread.is_alive() and not future.done():
+                writer = get_writer()
+                future = writer.submit(statements)
+
+
+@atexit.register
+def _stop_writer():
+    if _writer is not None and _writer.pid == os.getpid():
+        _writer.stop()
+
+
 def execute(sql, params=None):
     """execute parameterized SQL with values interpolated from params
 
@@ -64,16 +331,14 @@ def execute(sql, params=None):
     ```
     https://docs.python.org/3/library/sqlite3.html#how-to-use-placeholders-to-bind-values-in-sql-queries
 
+    writes are queued to this process' DBWriter & group committed, see DBWriter
+
     returns number of rows affected"""
     log.debug(f"execute: {sql} {params}")
     if not params:
         params = ()
 
-    rowcount = 0
-    with dbopen() as cur:
-        cur.execute(sql, params)
-        rowcount = cur.rowcount
-    return rowcount
+    return _write([(sql, params, False)])[0]
 
 
 def executemany(sql, params=None):
@@ -87,11 +352,22 @@ def executemany(sql, params=None):
     if not params:
         raise ValueError("executemany() without values makes no sense")
 
-    rowcount = 0
-    with dbopen() as cur:
-        cur.executemany(sql, params)
-        rowcount = cur.rowcount
-    return rowcount
+    return _write([(sql, params, True)])[0]
+
+
+def executeall(statements):
+    """execute several statements atomically: all are committed or none
+
+    statements is list of (sql, params) or (sql, params, many) tuples, with
+    params for many=True being a list as passed to executemany()
+
+    returns list of number of rows affected by each statement"""
+    log.debug(f"executeall: {len(statements)} statements")
+    normalized = []
+    for stmt in statements:
+        sql, params, *many = stmt
+        normalized.append((sql, params or (), bool(many and many[0])))
+    return _write(normalized)
 
 
 def executescript(sql_stmts):
@@ -122,6 +398,27 @@ def select(sql, params=None):
         return cur.fetchall()
 
 
+def iterselect(sql, params=None, batch_size=ITER_BATCH_SIZE):
+    """execute sql statement & yield rows as sqlite3.Rows
+
+    unlike select(), rows are fetched batch_size at a time so large results
+    are never held in memory at once; the connection stays open until the
+    generator is exhausted or closed
+
+    yields sqlite3.Row objects"""
+    log.debug(f"iterselect: {sql} {params}")
+    if not params:
+        params = ()
+
+    with dbopen(readonly=True, row_factory=sqlite3.Row) as cur:
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+
+
 def selectone(sql, params=None):
     """execute sql statement & return row values as sqlite3.Row object
 
@@ -156,6 +453,17 @@ def dbinit():
     executefile(SQL_INGEST_PATH)
     executefile(SQL_DISCOGS_PATH)
     executefile(SQL_CONFIG_PATH)
+    executescript("DROP TABLE IF EXISTS profile_policy; "
+                  "DROP TABLE IF EXISTS profile_config; "
+                  "DROP TABLE IF EXISTS profile;")
+    create_profile_tables()
+
+
+def create_profile_tables():
+    """creates seller profile tables if they do not exist yet
+
+    safe to run repeatedly; existing profiles are left untouched"""
+    executefile(SQL_PROFILE_PATH)
 
 
 def recreate_ingest_tables():
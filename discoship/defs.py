@@ -15,6 +15,14 @@ USPS_SVC_FCMI = "First-Class"
 USPS_SVC_FCPIS = "FCPIS"
 USPS_SVC_AIR = "IPA"
 USPS_SVC_AIRLIFT = "ISAL"
+USPS_SERVICES = (
+    USPS_SVC_PMEI,
+    USPS_SVC_PMI,
+    USPS_SVC_FCMI,
+    USPS_SVC_FCPIS,
+    USPS_SVC_AIR,
+    USPS_SVC_AIRLIFT,
+)
 
 DEFAULT_PROVIDER = "USPS"
 DEFAULT_SERVICE = USPS_SVC_FCPIS
@@ -30,3 +38,4 @@ DB_PATH = os.path.sep.join([PKG_PATH, 'data', 'discoship.db'])
 SQL_INGEST_PATH = os.path.sep.join([PKG_PATH, 'data', 'create-ingest-tables.sql'])
 SQL_DISCOGS_PATH = os.path.sep.join([PKG_PATH, 'data', 'create-discogs-tables.sql'])
 SQL_CONFIG_PATH = os.path.sep.join([PKG_PATH, 'data', 'create-config-table.sql'])
+SQL_PROFILE_PATH = os.path.sep.join([PKG_PATH, 'data', 'create-profile-tables.sql'])
@@ -87,6 +87,6 @@ def ingest_destinations(destinations):
 
 
 def fetch(source=SHIP_DESTS_PATH):
-    destinations = parse_destinations()
+    destinations = parse_destinations(source)
     ingest_destinations(destinations)
 
@@ -0,0 +1,196 @@
+"""
+bulk export of shipping policies to CSV/JSON
+
+Each export job writes one file per (profile, service, format), streaming
+rows from a sqlite3 cursor straight into the writers, so memory use does not
+grow with the size of the rate tables.  A profile here is a name & a set of
+pricing rules (see discoship.pricing & discoship.profiles); the "default"
+profile exports USPS rates as is.
+
+Next to each output a .fingerprint file records a hash of the rate rows, rules
+& format it was generated from; unless forced, jobs whose fingerprint is
+unchanged are skipped rather than rewritten.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import hashlib
+import json
+import logging
+import os
+
+from discoship.defs import VERSION
+from discoship.pricing import RATE_MATRIX_SQL, apply_rules, compile_rules, iter_rate_rows, rate_bands
+
+
+log = logging.getLogger(__name__)
+
+
+EXPORT_FORMATS = ("csv", "json")
+DEFAULT_PROFILE = "default"
+# max profiles written per export job; each holds an open output file
+EXPORT_CHUNK_SIZE = 64
+
+
+def rates_digest(service):
+    """returns hex digest of the rate rows of service as currently in the db
+
+    rows are streamed through the hash, so any change to the source data,
+    by ingest or by hand, changes the digest"""
+    digest = hashlib.sha256()
+    for row in iter_rate_rows(service):
+        digest.update(json.dumps(tuple(row)).encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def source_fingerprint(rates, service, rules, fmt):
+    """returns hex digest identifying the inputs of an export
+
+    rates is rates_digest() of service"""
+    source = json.dumps([VERSION, service, fmt, rules, rates], sort_keys=True)
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def export_path(outdir, profile, service, fmt):
+    return os.path.join(outdir, f"{profile}-{service}.{fmt}")
+
+
+def policy_row(rules, service, bands, rate_row):
+    """prices one streamed rate row with compiled rules
+
+    returns dict {country_name, service, price_group, <band>: price, ...}"""
+    country, price_group = rate_row["country_name"], rate_row["price_group"]
+    row = {"country_name": country, "service": service, "price_group": price_group}
+    for band in bands:
+        row[band] = apply_rules(rules, country, service, price_group, band, rate_row[band])
+    return row
+
+
+class CsvPolicyWriter:
+    def __init__(self, fh, service):
+        self.writer = csv.DictWriter(fh, fieldnames=["country_name", "service", "price_group",
+                                                     *rate_bands(service)])
+        self.writer.writeheader()
+        self.rowcount = 0
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+        self.rowcount += 1
+
+    def close(self):
+        pass
+
+
+class JsonPolicyWriter:
+    """writes a JSON array element by element instead of json.dump(list(rows))"""
+
+    def __init__(self, fh, service):
+        self.fh = fh
+        self.fh.write("[")
+        self.rowcount = 0
+
+    def writerow(self, row):
+        self.fh.write(",\n  " if self.rowcount else "\n  ")
+        self.fh.write(json.dumps(row))
+        self.rowcount += 1
+
+    def close(self):
+        self.fh.write("\n]\n")
+
+
+WRITERS = {
+    "csv": CsvPolicyWriter,
+    "json": JsonPolicyWriter,
+}
+
+
+def _is_unchanged(path, fingerprint):
+    fingerprint_path = f"{path}.fingerprint"
+    if not (os.path.exists(path) and os.path.exists(fingerprint_path)):
+        return False
+    with open(fingerprint_path) as fh:
+        return fh.read().strip() == fingerprint
+
+
+def export_service(outdir, service, fmt, profiles, force=False):
+    """writes policy of each of profiles for service to outdir in format fmt
+
+    profiles is dict {profile_name: [rule dicts]}.  Rates are streamed from
+    the db once & every row is fanned out to all profiles' writers.  Output
+    is written to temp files & renamed into place, so a failed or interrupted
+    export never leaves a truncated file behind.
+
+    returns list of (path, rowcount) where rowcount is None if skipped"""
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format {fmt}, expected one of {EXPORT_FORMATS}")
+    bands = rate_bands(service)
+    rates = rates_digest(service)
+    results = {}
+    pending = []
+    for profile, rules in profiles.items():
+        rules = list(rules)
+        path = export_path(outdir, profile, service, fmt)
+        fingerprint = source_fingerprint(rates, service, rules, fmt)
+        if not force and _is_unchanged(path, fingerprint):
+            log.info(f"export_service: {path} unchanged, skipping")
+            results[path] = None
+        else:
+            pending.append((path, fingerprint, compile_rules(rules)))
+
+    if pending:
+        handles = []
+        try:
+            for path, fingerprint, rules in pending:
+                fh = open(f"{path}.tmp", "w", newline="")
+                handles.append(fh)
+            writers = [WRITERS[fmt](fh, service) for fh in handles]
+            for rate_row in iter_rate_rows(service):
+                for (path, fingerprint, rules), writer in zip(pending, writers):
+                    writer.writerow(policy_row(rules, service, bands, rate_row))
+            for writer, fh in zip(writers, handles):
+                writer.close()
+                fh.close()
+            for (path, fingerprint, rules), writer in zip(pending, writers):
+                os.replace(f"{path}.tmp", path)
+                with open(f"{path}.fingerprint", "w") as fh:
+                    fh.write(f"{fingerprint}\n")
+                results[path] = writer.rowcount
+                log.info(f"export_service: wrote {writer.rowcount} rows to {path}")
+        finally:
+            for fh, (path, fingerprint, rules) in zip(handles, pending):
+                fh.close()
+                if os.path.exists(f"{path}.tmp"):
+                    os.remove(f"{path}.tmp")
+    return list(results.items())
+
+
+def export_policies(outdir, services, profiles, formats=("csv",), force=False, jobs=None,
+                    chunk_size=EXPORT_CHUNK_SIZE):
+    """exports every combination of services, profiles & formats in parallel
+
+    profiles is dict {profile_name: [rule dicts]}; each job streams rates of
+    one service once for up to chunk_size profiles.  Services without an
+    ingested rate table are logged & skipped
+
+    returns list of (path, rowcount), rowcount None for skipped exports"""
+    os.makedirs(outdir, exist_ok=True)
+    exportable = []
+    for service in services:
+        if service in RATE_MATRIX_SQL:
+            exportable.append(service)
+        else:
+            log.warning(f"export_policies: no rate table ingested for {service}, skipping")
+
+    names = list(profiles)
+    chunks = [{name: profiles[name] for name in names[i:i + chunk_size]}
+              for i in range(0, len(names), chunk_size)]
+    job_args = [(outdir, service, fmt, chunk, force)
+                for chunk in chunks
+                for service in exportable
+                for fmt in formats]
+    log.info(f"export_policies: {len(job_args)} export jobs to {outdir}")
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for future in [pool.submit(export_service, *args) for args in job_args]:
+            results.extend(future.result())
+    return results
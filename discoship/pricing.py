@@ -0,0 +1,299 @@
+"""
+what-if repricing on top of ingested USPS rates
+
+Rules are declared as a list of dicts (typically loaded from a JSON file) and
+applied in order to every cell of the country x service x weight band matrix:
+```
+[
+    {"rule": "markup", "percent": 8},
+    {"rule": "fee", "amount": 1.50},
+    {"rule": "surcharge", "amount": 3.00, "price_groups": [15, 16, 17]},
+    {"rule": "surcharge", "amount": 2.00, "countries": ["Brazil"], "bands": ["weight_to_64oz"]},
+    {"rule": "round", "ending": 0.99}
+]
+```
+Any rule may be restricted with the optional match keys "countries",
+"price_groups", "services" and "bands"; a rule without match keys applies to
+every cell.
+
+Rules are compiled once by compile_rules() into plain functions, & the rate
+matrix is read from the db once by load_rate_matrix(), so repeated calls to
+reprice() with different scenarios only do arithmetic.
+"""
+import json
+import logging
+import math
+
+from discoship.db import ITER_BATCH_SIZE, iterselect, selectone
+from discoship.defs import USPS_SVC_FCPIS
+
+
+log = logging.getLogger(__name__)
+
+
+# usps_fcpis_rates columns, in increasing weight order
+FCPIS_BANDS = ("weight_to_8oz", "weight_to_32oz", "weight_to_48oz", "weight_to_64oz")
+# max package weight (oz) of each band
+FCPIS_BAND_MAX_OZ = dict(zip(FCPIS_BANDS, (8, 32, 48, 64)))
+
+MATCH_KEYS = ("countries", "price_groups", "services", "bands")
+
+SELECT_FCPIS_RATE_MATRIX = f"""
+  SELECT c.country_name, c.usps_service_code, c.price_group,
+    {', '.join(f'r.{band}' for band in FCPIS_BANDS)}
+  FROM usps_cpg c
+  JOIN usps_fcpis_rates r ON r.price_group = c.price_group
+  WHERE c.usps_service_code = ?
+  ORDER BY c.country_name;
+"""
+
+SELECT_FCPIS_COUNTRY_RATES = f"""
+  SELECT c.country_name, c.usps_service_code, c.price_group,
+    {', '.join(f'r.{band}' for band in FCPIS_BANDS)}
+  FROM usps_cpg c
+  JOIN usps_fcpis_rates r ON r.price_group = c.price_group
+  WHERE c.usps_service_code = ? AND c.country_name = ?;
+"""
+
+# services with an ingested rate table: {service: (select sql, bands)}
+RATE_MATRIX_SQL = {
+    USPS_SVC_FCPIS: (SELECT_FCPIS_RATE_MATRIX, FCPIS_BANDS),
+}
+
+
+def rate_bands(service):
+    """returns weight band column names of service's rate table
+
+    raises ValueError if no rate table exists for service"""
+    if service not in RATE_MATRIX_SQL:
+        raise ValueError(f"No rate table ingested for service {service}")
+    return RATE_MATRIX_SQL[service][1]
+
+
+def iter_rate_rows(service=USPS_SVC_FCPIS, batch_size=ITER_BATCH_SIZE):
+    """streams current rates of service, one row per country
+
+    yields sqlite3.Row with keys country_name, usps_service_code, price_group
+    & one key per weight band, see rate_bands()"""
+    rate_bands(service)
+    sql = RATE_MATRIX_SQL[service][0]
+    yield from iterselect(sql, (service,), batch_size=batch_size)
+
+
+def load_rate_matrix(service=USPS_SVC_FCPIS):
+    """reads current rates for every country & weight band of service
+
+    returns list of (country, service, price_group, band, price) tuples"""
+    log.debug(f"load_rate_matrix: service={service}")
+    bands = rate_bands(service)
+    matrix = []
+    for row in iter_rate_rows(service):
+        for band in bands:
+            matrix.append((row["country_name"], row["usps_service_code"],
+                           row["price_group"], band, row[band]))
+    log.info(f"load_rate_matrix: loaded {len(matrix)} {service} rates")
+    return matrix
+
+
+def weight_band(weight_oz, service=USPS_SVC_FCPIS):
+    """returns name of the lightest weight band of service fitting weight_oz
+
+    raises ValueError if weight_oz is not positive or exceeds the service's
+    max weight"""
+    rate_bands(service)
+    if weight_oz <= 0:
+        raise ValueError(f"Package weight must be positive, got {weight_oz}oz")
+    for band, max_oz in FCPIS_BAND_MAX_OZ.items():
+        if weight_oz <= max_oz:
+            return band
+    raise ValueError(f"{weight_oz}oz exceeds {service} max weight of {max(FCPIS_BAND_MAX_OZ.values())}oz")
+
+
+def quote(country, weight_oz, service=USPS_SVC_FCPIS, rules=()):
+    """prices one package of weight_oz to country, applying rules
+
+    like reprice(), rules may be compiled or a list of rule dicts
+
+    raises ValueError for unknown countries & invalid package weights
+
+    returns price"""
+    rules = _compiled(rules)
+    band = weight_band(weight_oz, service)
+    row = selectone(SELECT_FCPIS_COUNTRY_RATES, (service, country))
+    if row is None:
+        raise ValueError(f"No {service} rate for country {country!r}")
+    return apply_rules(rules, country, service, row["price_group"], band, row[band])
+
+
+def _compile_matcher(rule):
+    """returns function (country, service, price_group, band) -> bool"""
+    countries = set(rule.get("countries") or ())
+    price_groups = set(int(pg) for pg in rule.get("price_groups") or ())
+    services = set(rule.get("services") or ())
+    bands = set(rule.get("bands") or ())
+    unknown = services.difference(RATE_MATRIX_SQL)
+    if unknown:
+        raise ValueError(f"Unknown services {sorted(unknown)}, expected one of {sorted(RATE_MATRIX_SQL)}")
+    unknown = bands.difference(FCPIS_BANDS)
+    if unknown:
+        raise ValueError(f"Unknown weight bands {sorted(unknown)}, expected one of {list(FCPIS_BANDS)}")
+
+    def matches(country, service, price_group, band):
+        return ((not countries or country in countries)
+                and (not price_groups or price_group in price_groups)
+                and (not services or service in services)
+                and (not bands or band in bands))
+
+    if not (countries or price_groups or services or bands):
+        return None
+    return matches
+
+
+def _markup(rule):
+    factor = 1 + float(rule["percent"]) / 100
+    return lambda price: price * factor
+
+
+def _fee(rule):
+    amount = float(rule["amount"])
+    return lambda price: price + amount
+
+
+def _round(rule):
+    """rounds up to the next price ending in "ending", e.g. 0.99 or 0.49
+
+    with "increment" prices are spaced that far apart, e.g. increment 5 and
+    ending 0.99 turns 17.85 into 20.99 (prices 15.99, 20.99, 25.99...)"""
+    ending = float(rule.get("ending", 0))
+    increment = float(rule.get("increment", 1))
+    if not 0 <= ending < increment:
+        raise ValueError(f"round rule ending must be >= 0 and < increment: {rule}")
+
+    def charm(price):
+        # round() first so float noise (e.g. 18.99 - 0.99) doesn't bump a band
+        steps = math.ceil(round((price - ending) / increment, 6))
+        return steps * increment + ending
+    return charm
+
+
+# "surcharge" is a fee in spirit restricted to some region, but is kept as
+# its own name so rule files read the way they are discussed
+RULE_TYPES = {
+    "markup": _markup,
+    "fee": _fee,
+    "surcharge": _fee,
+    "round": _round,
+}
+
+# parameters each rule type accepts, besides "rule" & MATCH_KEYS
+RULE_PARAMS = {
+    "markup": {"percent"},
+    "fee": {"amount"},
+    "surcharge": {"amount"},
+    "round": {"ending", "increment"},
+}
+
+
+def compile_rules(rules):
+    """validates rules & compiles each into a function
+
+    raises ValueError if rules is not a list of dicts, for unknown rule types
+    or keys, & for invalid rule parameters; a misspelled match key would
+    otherwise silently apply a rule to every cell
+
+    returns list of (matcher, func) where matcher is None for rules applying
+    to all cells, func is price -> price"""
+    if not isinstance(rules, (list, tuple)):
+        raise ValueError(f"Rules must be a list of rule objects, got {type(rules).__name__}")
+    compiled = []
+    for rule in rules:
+        if not isinstance(rule, dict):
+            raise ValueError(f"Rule must be an object, got {rule!r}")
+        rule_type = rule.get("rule")
+        if rule_type not in RULE_TYPES:
+            raise ValueError(f"Unknown rule type {rule_type!r}, expected one of {sorted(RULE_TYPES)}")
+        allowed = {"rule", *MATCH_KEYS, *RULE_PARAMS[rule_type]}
+        unknown = set(rule).difference(allowed)
+        if unknown:
+            raise ValueError(f"Unknown keys {sorted(unknown)} in {rule_type} rule {rule}, "
+                             f"expected some of {sorted(allowed)}")
+        if rule_type == "surcharge" and not any(rule.get(k) for k in MATCH_KEYS):
+            raise ValueError(f"surcharge rule needs one of {MATCH_KEYS}: {rule}")
+        try:
+            func = RULE_TYPES[rule_type](rule)
+            matcher = _compile_matcher(rule)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid {rule_type} rule {rule}: {e}") from e
+        compiled.append((matcher, func))
+    return compiled
+
+
+def read_rules(path):
+    """reads list of rule dicts from JSON file at path
+
+    raises ValueError if the file does not hold a JSON list of objects
+
+    returns list of (uncompiled) rule dicts"""
+    log.info(f"read_rules: {path}")
+    with open(path) as fh:
+        rules = json.load(fh)
+    if not isinstance(rules, list) or not all(isinstance(rule, dict) for rule in rules):
+        raise ValueError(f"{path} must hold a JSON list of rule objects")
+    return rules
+
+
+def _compiled(rules):
+    """returns rules compiled, unless they already are"""
+    if rules and isinstance(rules[0], dict):
+        return compile_rules(rules)
+    return rules
+
+
+def load_rules(path):
+    """reads & compiles rules from JSON file at path
+
+    returns compiled rules, see compile_rules()"""
+    return compile_rules(read_rules(path))
+
+
+def apply_rules(rules, country, service, price_group, band, price):
+    """applies compiled rules in order to a single matrix cell
+
+    returns new price rounded to cents"""
+    for matcher, func in rules:
+        if matcher is None or matcher(country, service, price_group, band):
+            price = func(price)
+    return round(price, 2)
+
+
+def reprice(rules, matrix=None):
+    """applies compiled rules to each cell of matrix (default current rates)
+
+    rules may be given uncompiled as a list of dicts; pass compiled rules &
+    a preloaded matrix when iterating on scenarios to skip both steps
+
+    returns (policy, diff) where policy is dict
+    {(country, service, band): new_price} and diff is list of
+    (country, service, band, current_price, new_price, delta) tuples for
+    each price that changed"""
+    rules = _compiled(rules)
+    if matrix is None:
+        matrix = load_rate_matrix()
+
+    policy = {}
+    diff = []
+    for country, service, price_group, band, current in matrix:
+        price = apply_rules(rules, country, service, price_group, band, current)
+        policy[(country, service, band)] = price
+        if price != current:
+            diff.append((country, service, band, current, price, round(price - current, 2)))
+    log.info(f"reprice: {len(diff)} of {len(policy)} prices changed")
+    return policy, diff
+
+
+def format_diff(diff):
+    """returns diff from reprice() as aligned text table"""
+    lines = [f"{'country':<32} {'service':<8} {'band':<15} {'current':>8} {'new':>8} {'delta':>8}"]
+    for country, service, band, current, price, delta in diff:
+        lines.append(f"{country:<32} {service:<8} {band:<15} {current:>8.2f} {price:>8.2f} {delta:>+8.2f}")
+    return "\n".join(lines)
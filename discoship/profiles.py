@@ -0,0 +1,212 @@
+"""
+seller profiles: many shops' config & policies in one db
+
+Ingested USPS/Discogs tables are shared by every profile.  Each profile has
+its own config overrides (profile_config, falling back to the global config
+table) & its own generated policy prices (profile_policy).  A profile's
+pricing rules (see discoship.pricing) are kept in its config under
+RULES_CONFIG_KEY as JSON.
+
+Merged profile configs are cached in-process, keyed on the versions of the
+tables they are read from (see discoship.db.table_version()), so any write
+this process commits to config (ingest dates, reset_config(), ...), profile
+or profile_config invalidates them.  Writes made by other processes
+are not seen until clear_config_cache() is called.
+"""
+import json
+import logging
+import re
+import threading
+
+from discoship.db import dump_config, execute, executeall, select, selectone, table_version
+from discoship.defs import USPS_SVC_FCPIS
+from discoship.pricing import compile_rules, load_rate_matrix, reprice
+
+
+log = logging.getLogger(__name__)
+
+
+RULES_CONFIG_KEY = "pricing_rules"
+# profile names end up in export file names
+PROFILE_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+INSERT_PROFILE = """
+  INSERT INTO profile (name) VALUES (?);
+"""
+
+DELETE_PROFILE = """
+  DELETE FROM profile WHERE name = ?;
+"""
+
+SELECT_PROFILES = """
+  SELECT name FROM profile ORDER BY name;
+"""
+
+SELECT_PROFILE = """
+  SELECT name FROM profile WHERE name = ?;
+"""
+
+SELECT_PROFILE_CONFIG = """
+  SELECT name, value FROM profile_config WHERE profile = ?;
+"""
+
+UPSERT_PROFILE_CONFIG = """
+  INSERT INTO profile_config (profile, name, value)
+  VALUES (?, ?, ?)
+  ON CONFLICT (profile, name)
+  DO UPDATE SET value = excluded.value;
+"""
+
+DELETE_PROFILE_CONFIG = """
+  DELETE FROM profile_config WHERE profile = ? AND name = ?;
+"""
+
+INSERT_PROFILE_POLICY = """
+  INSERT INTO profile_policy (profile, country_name, usps_service_code, band, price)
+  VALUES (?, ?, ?, ?, ?)
+  ON CONFLICT (profile, country_name, usps_service_code, band)
+  DO UPDATE SET price = excluded.price;
+"""
+
+DELETE_PROFILE_POLICY = """
+  DELETE FROM profile_policy WHERE profile = ? AND usps_service_code = ?;
+"""
+
+SELECT_PROFILE_POLICY = """
+  SELECT country_name, usps_service_code, band, price FROM profile_policy
+  WHERE profile = ? AND usps_service_code = ?
+  ORDER BY country_name, band;
+"""
+
+
+# tables a merged profile config is read from
+CONFIG_TABLES = ("config", "profile", "profile_config")
+
+# {profile: (_config_versions() read before the db was, merged config)}
+_config_cache = {}
+_config_cache_lock = threading.Lock()
+
+
+def _config_versions():
+    return tuple(table_version(table) for table in CONFIG_TABLES)
+
+
+def clear_config_cache(profile=None):
+    """drops cached config of profile, or of every profile if None"""
+    with _config_cache_lock:
+        if profile is None:
+            _config_cache.clear()
+        else:
+            _config_cache.pop(profile, None)
+
+
+def list_profiles():
+    """returns list of profile names"""
+    return [row["name"] for row in select(SELECT_PROFILES)]
+
+
+def profile_exists(name):
+    return selectone(SELECT_PROFILE, (name,)) is not None
+
+
+def check_profile(name):
+    """raises ValueError if profile name does not exist"""
+    if not profile_exists(name):
+        raise ValueError(f"No such profile {name!r}")
+
+
+def create_profile(name):
+    """adds profile name; its config starts out as the global config
+
+    raises ValueError if name is not usable as part of a file name,
+    sqlite3.IntegrityError if profile already exists"""
+    if not PROFILE_NAME_RE.match(name):
+        raise ValueError(f"Invalid profile name {name!r}, expected letters, digits, '_', '.' or '-'")
+    execute(INSERT_PROFILE, (name,))
+    clear_config_cache(name)
+    log.info(f"create_profile: {name}")
+
+
+def delete_profile(name):
+    """removes profile name along with its config & policies"""
+    rowcount = execute(DELETE_PROFILE, (name,))
+    clear_config_cache(name)
+    if not rowcount:
+        raise ValueError(f"No such profile {name!r}")
+    log.info(f"delete_profile: {name}")
+
+
+def get_config(profile):
+    """returns dict of global config overlaid with profile's own config
+
+    result is cached until the profile's or the global config is written;
+    treat it as read-only
+
+    raises ValueError if profile does not exist"""
+    # read before the db: a write committing meanwhile bumps the versions, so
+    # a config built from pre-write rows is never served as current
+    version = _config_versions()
+    with _config_cache_lock:
+        cached = _config_cache.get(profile)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+    check_profile(profile)
+    config = dump_config()
+    config.update({row["name"]: row["value"] for row in select(SELECT_PROFILE_CONFIG, (profile,))})
+    with _config_cache_lock:
+        _config_cache[profile] = (version, config)
+    return config
+
+
+def set_config(profile, name, value):
+    """sets config name to value for profile only"""
+    execute(UPSERT_PROFILE_CONFIG, (profile, name, value))
+    clear_config_cache(profile)
+
+
+def unset_config(profile, name):
+    """removes profile's override of config name, reverting to global value"""
+    execute(DELETE_PROFILE_CONFIG, (profile, name))
+    clear_config_cache(profile)
+
+
+def get_rules(profile):
+    """returns list of profile's (uncompiled) pricing rule dicts"""
+    rules = get_config(profile).get(RULES_CONFIG_KEY)
+    return json.loads(rules) if rules else []
+
+
+def set_rules(profile, rules):
+    """validates & stores list of pricing rule dicts for profile"""
+    compile_rules(rules)
+    set_config(profile, RULES_CONFIG_KEY, json.dumps(rules))
+
+
+def generate_policies(profiles=None, service=USPS_SVC_FCPIS):
+    """generates profile_policy prices for each of profiles (default all)
+
+    the shared rate matrix is read once & repriced per profile; each
+    profile's previous policy for service is replaced in the same write, so
+    countries dropped from the rate tables since do not linger
+
+    returns dict {profile: number of prices written}"""
+    if profiles is None:
+        profiles = list_profiles()
+    matrix = load_rate_matrix(service)
+    counts = {}
+    for profile in profiles:
+        policy, diff = reprice(compile_rules(get_rules(profile)), matrix)
+        vals = [(profile, country, svc, band, price)
+                for (country, svc, band), price in policy.items()]
+        statements = [(DELETE_PROFILE_POLICY, (profile, service))]
+        if vals:
+            statements.append((INSERT_PROFILE_POLICY, vals, True))
+        counts[profile] = executeall(statements)[-1] if vals else 0
+        log.info(f"generate_policies: {profile} {counts[profile]} {service} prices")
+    return counts
+
+
+def dump_policy(profile, service=USPS_SVC_FCPIS):
+    """returns dict {(country, band): price} of profile's generated policy"""
+    rows = select(SELECT_PROFILE_POLICY, (profile, service))
+    return {(row["country_name"], row["band"]): row["price"] for row in rows}
@@ -108,8 +108,15 @@ def fetch_cpg_data(url=CPG_DATA_URL, service=DEFAULT_SERVICE):
 
     returns dict {country: price_group}"""
     log.info(f"fetching CPG data from {url}")
-    cpg_data = {}
     html = fetch_url(url)
+    return parse_cpg_data(html, service=service)
+
+
+def parse_cpg_data(html, service=DEFAULT_SERVICE):
+    """parses Country Price Group data from html of CPG_DATA_URL page
+
+    returns dict {country: price_group}"""
+    cpg_data = {}
     soup = bs4.BeautifulSoup(html, 'html.parser')
     h2s = soup.body.find_all('h2', string=re.compile(CPG_HEADER_TEXT))
     log.debug(f'Found {len(h2s)} <h2> elements w/text {CPG_HEADER_TEXT}')
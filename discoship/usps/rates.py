@@ -114,6 +114,14 @@ def fetch_fcpis_rates_data(url=RATE_TABLE_URL):
     """
     log.info(f'fetching rates data from {url}')
     html = fetch_url(url)
+    return parse_fcpis_rates_data(html)
+
+
+def parse_fcpis_rates_data(html):
+    """parses FCPIS price by weight per price_group tables from html of
+    RATE_TABLE_URL page, see fetch_fcpis_rates_data()
+
+    returns dict {price_group: [rate, rate, rate, rate]}"""
     soup = bs4.BeautifulSoup(html, 'html.parser')
     soup = soup.body.find(id='pe-content-document')
     atag = soup.find(id=f'a_{FCPIS_RATE_TABLE_HEADER_TEXT}')
@@ -0,0 +1,19 @@
+import shutil
+
+import pytest
+
+import discoship.db
+from discoship.defs import DB_PATH
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """points discoship.db at a scratch copy of the packaged db"""
+    path = str(tmp_path / "discoship.db")
+    shutil.copy(DB_PATH, path)
+    monkeypatch.setattr(discoship.db, "DB_PATH", path)
+    yield path
+    # the writer's connection is bound to this test's db
+    if discoship.db._writer is not None:
+        discoship.db._writer.stop()
+        discoship.db._writer = None
@@ -0,0 +1,127 @@
+"""
+discoship.aio must never block the event loop: a ticker coroutine measures
+how late it wakes up while concurrent fetches against a slow local stand-in
+server & quotes run
+"""
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import statistics
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+from discoship import aio, pricing, profiles  # noqa: E402
+from discoship.db import create_profile_tables  # noqa: E402
+
+
+# each stand-in response takes this long, so a single fetch blocking the
+# loop would show up as at least this much lag
+SERVER_DELAY = 0.3
+FETCHES = 100
+QUOTES = 500
+TICK = 0.005
+# median: the loop is essentially idle, only GIL hand-offs to the worker
+# threads (5ms switch interval) delay a tick
+MAX_MEDIAN_LAG = 0.010
+# max: ~40-60ms seen from GIL contention of 12 busy worker threads; kept
+# below SERVER_DELAY so one blocking fetch fails the test
+MAX_LAG = 0.25
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(SERVER_DELAY)
+        body = b"x" * 50_000
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+    server.server_close()
+
+
+async def _ticker(stop, lags):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+def test_concurrent_load_does_not_block_loop(db_path, server_url):
+    async def main():
+        # warm up executors & connections outside of the measurement
+        await asyncio.gather(aio.fetch(server_url), aio.quote("Brazil", 1))
+        stop, lags = asyncio.Event(), []
+        ticker = asyncio.create_task(_ticker(stop, lags))
+        start = time.perf_counter()
+        results = await asyncio.gather(*[aio.fetch(server_url) for _ in range(FETCHES)],
+                                       *[aio.quote("Brazil", i % 64 + 1) for i in range(QUOTES)])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await ticker
+        return results, lags, elapsed
+
+    results, lags, elapsed = asyncio.run(main())
+    median, worst = statistics.median(lags), max(lags)
+    print(f"\n{FETCHES + QUOTES} ops in {elapsed:.2f}s, loop lag "
+          f"median {median * 1000:.2f}ms max {worst * 1000:.2f}ms")
+    assert len(results[0]) == 50_000
+    assert median < MAX_MEDIAN_LAG
+    assert worst < MAX_LAG
+
+
+def test_cancelled_fetch_raises_cancelled(server_url):
+    async def main():
+        task = asyncio.create_task(aio.fetch(server_url))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+
+
+def test_quote(db_path):
+    create_profile_tables()
+    profiles.clear_config_cache()
+    profiles.create_profile("shopA")
+    profiles.set_rules("shopA", [{"rule": "fee", "amount": 1}])
+    base = asyncio.run(aio.quote("Brazil", 40))
+    assert asyncio.run(aio.quote("Brazil", 40, profile="shopA")) == round(base + 1, 2)
+    with pytest.raises(ValueError):
+        asyncio.run(aio.quote("Brazil", 40, profile="nope"))
+    for weight in (0, -1, 65):
+        with pytest.raises(ValueError):
+            asyncio.run(aio.quote("Brazil", weight))
+
+
+def test_quote_accepts_rule_dicts(db_path):
+    base = pricing.quote("Brazil", 40)
+    assert pricing.quote("Brazil", 40, rules=[{"rule": "fee", "amount": 1}]) == round(base + 1, 2)
+
+
+def test_ingest_discogs_source(db_path, tmp_path):
+    pytest.importorskip("bs4")
+    from discoship.db import select
+    source = tmp_path / "destinations.htm"
+    source.write_text('<span class="region-name">Atlantis</span>'
+                      '<span class="region-name">North America</span>')
+    asyncio.run(aio.ingest("discogs", source=str(source)))
+    countries = [row["country_name"] for row in select("SELECT country_name FROM discogs_destination_countries")]
+    assert "Atlantis" in countries
+    assert "North America" not in countries
@@ -0,0 +1,132 @@
+"""
+stress test for discoship.db's DBWriter: many processes x threads writing &
+reading concurrently must never see "database is locked"
+"""
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+import sqlite3
+import time
+
+import pytest
+
+import discoship.db
+
+
+PROCESSES = 16
+THREADS = 8
+WRITES_PER_THREAD = 50
+# ~1300-1900 writes/s measured on a 16 process run; the floor is kept well
+# below that so only a real regression (e.g. writes serialized per
+# connection open or lock errors retried to exhaustion) trips it
+MIN_WRITES_PER_SEC = 300
+
+UPSERT_CONFIG = """
+  INSERT INTO config (name, value) VALUES (?, ?)
+  ON CONFLICT (name) DO UPDATE SET value = excluded.value;
+"""
+
+
+def _thread_work(worker, thread):
+    errors = []
+    for i in range(WRITES_PER_THREAD):
+        try:
+            discoship.db.execute(UPSERT_CONFIG, (f"stress-{worker}-{thread}-{i}", i))
+            discoship.db.select("SELECT COUNT(*) FROM config")
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+    return errors
+
+
+def _init_process(db_path, barrier):
+    # fresh interpreter under spawn: point this process at the test db &
+    # wait for all processes to be up, so startup isn't timed as throughput
+    discoship.db.DB_PATH = db_path
+    barrier.wait()
+
+
+def _process_work(worker):
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        results = pool.map(_thread_work, [worker] * THREADS, range(THREADS))
+        errors = [e for errors in results for e in errors]
+    return errors, start, time.time()
+
+
+def test_concurrent_writers_no_lock_errors(db_path):
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Manager().Barrier(PROCESSES)
+    with ctx.Pool(PROCESSES, initializer=_init_process, initargs=(db_path, barrier)) as pool:
+        results = pool.map(_process_work, range(PROCESSES))
+    elapsed = max(end for _, _, end in results) - min(start for _, start, _ in results)
+
+    errors = [e for errors, _, _ in results for e in errors]
+    writes = PROCESSES * THREADS * WRITES_PER_THREAD
+    print(f"\n{writes} writes in {elapsed:.2f}s: {writes / elapsed:.0f} writes/s")
+    assert errors == []
+    assert writes / elapsed > MIN_WRITES_PER_SEC
+    row = discoship.db.selectone("SELECT COUNT(*) FROM config WHERE name LIKE 'stress-%'")
+    assert row[0] == writes
+
+
+def test_failed_write_raises_to_its_caller_only(db_path):
+    discoship.db.execute(UPSERT_CONFIG, ("stress-dup", 1))
+    with pytest.raises(sqlite3.IntegrityError):
+        discoship.db.execute("INSERT INTO config (name, value) VALUES ('stress-dup', 2)")
+    assert discoship.db.execute(UPSERT_CONFIG, ("stress-ok", 1)) == 1
+
+
+def test_dead_writer_is_restarted(db_path):
+    writer = discoship.db.get_writer()
+    writer.stop()
+    assert not writer.thread.is_alive()
+    assert discoship.db.execute(UPSERT_CONFIG, ("stress-restarted", 1)) == 1
+    assert discoship.db.get_writer() is not writer
+
+
+def test_failed_batch_resolves_futures(db_path, monkeypatch):
+    def broken_connect(self):
+        raise sqlite3.OperationalError("unable to open database file")
+    monkeypatch.setattr(discoship.db.DBWriter, "_connect", broken_connect)
+    with pytest.raises(sqlite3.OperationalError):
+        discoship.db.execute(UPSERT_CONFIG, ("stress-broken", 1))
+    assert discoship.db.get_writer().thread.is_alive()
+
+
+def test_request_submitted_to_replaced_dead_writer_is_resubmitted(db_path, monkeypatch):
+    monkeypatch.setattr(discoship.db, "WRITER_CHECK_INTERVAL", 0.05)
+    dead = discoship.db.get_writer()
+    dead.stop()
+    # another thread's get_writer() already replaced the dead writer, after
+    # this caller obtained it but before it submitted
+    discoship.db.get_writer()
+    real_get_writer = discoship.db.get_writer
+    handed_out = []
+
+    def get_writer():
+        if not handed_out:
+            handed_out.append(dead)
+            return dead
+        return real_get_writer()
+
+    monkeypatch.setattr(discoship.db, "get_writer", get_writer)
+    assert discoship.db.execute(UPSERT_CONFIG, ("stress-resubmitted", 1)) == 1
+    row = discoship.db.selectone("SELECT value FROM config WHERE name = 'stress-resubmitted'")
+    assert row[0] == 1
+
+
+def test_busy_group_commit_is_retried(db_path, monkeypatch):
+    monkeypatch.setattr(discoship.db, "BUSY_RETRY_DELAY", 0)
+    real_commit_batch = discoship.db.DBWriter._commit_batch
+    attempts = []
+
+    def busy_once(self, conn, batch):
+        attempts.append(1)
+        if len(attempts) == 1:
+            e = sqlite3.OperationalError("database is locked")
+            e.sqlite_errorcode = sqlite3.SQLITE_BUSY
+            raise e
+        return real_commit_batch(self, conn, batch)
+
+    monkeypatch.setattr(discoship.db.DBWriter, "_commit_batch", busy_once)
+    assert discoship.db.execute(UPSERT_CONFIG, ("stress-busy", 1)) == 1
+    assert len(attempts) == 2
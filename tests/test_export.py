@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+from discoship.cli import DiscoShipArgParser, delegate_args
+from discoship.db import execute, executefile
+from discoship.defs import SQL_INGEST_PATH, USPS_SVC_FCPIS
+from discoship.export import export_service
+
+
+def test_export_skips_unchanged(db_path, tmp_path):
+    profiles = {"default": []}
+    [(path, rowcount)] = export_service(str(tmp_path), USPS_SVC_FCPIS, "csv", profiles)
+    assert rowcount > 0
+    assert export_service(str(tmp_path), USPS_SVC_FCPIS, "csv", profiles) == [(path, None)]
+
+
+def test_export_fingerprints_rate_data(db_path, tmp_path):
+    profiles = {"default": []}
+    export_service(str(tmp_path), USPS_SVC_FCPIS, "json", profiles)
+
+    # hand edit w/out touching last_ingest_* dates
+    execute("UPDATE usps_fcpis_rates SET weight_to_8oz = 99 WHERE price_group = 1")
+    [(path, rowcount)] = export_service(str(tmp_path), USPS_SVC_FCPIS, "json", profiles)
+    assert rowcount is not None
+    with open(path) as fh:
+        assert 99 in [row["weight_to_8oz"] for row in json.load(fh)]
+
+    executefile(SQL_INGEST_PATH)
+    [(path, rowcount)] = export_service(str(tmp_path), USPS_SVC_FCPIS, "json", profiles)
+    assert rowcount == 0
+
+
+def test_cli_export_rejects_duplicate_profile_names(db_path, tmp_path):
+    for subdir in ("a", "b"):
+        (tmp_path / subdir).mkdir()
+        (tmp_path / subdir / "shop.json").write_text("[]")
+    args = DiscoShipArgParser.parse_args([
+        "export", "--outdir", str(tmp_path / "out"),
+        "--rules", str(tmp_path / "a" / "shop.json"),
+        "--rules", str(tmp_path / "b" / "shop.json"),
+    ])
+    with pytest.raises(SystemExit):
+        delegate_args(args)
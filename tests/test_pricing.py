@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+from discoship.defs import USPS_SVC_FCPIS
+from discoship.pricing import compile_rules, load_rate_matrix, read_rules, reprice
+
+
+MATRIX = [
+    ("Brazil", USPS_SVC_FCPIS, 15, "weight_to_8oz", 20.00),
+    ("Brazil", USPS_SVC_FCPIS, 15, "weight_to_64oz", 80.00),
+    ("Canada", USPS_SVC_FCPIS, 1, "weight_to_8oz", 10.00),
+    ("Canada", USPS_SVC_FCPIS, 1, "weight_to_64oz", 40.00),
+]
+
+
+def policy_of(rules, matrix=MATRIX):
+    policy, diff = reprice(rules, matrix)
+    return policy
+
+
+def test_markup_then_fee_order_matters():
+    markup_fee = policy_of([{"rule": "markup", "percent": 10}, {"rule": "fee", "amount": 1}])
+    fee_markup = policy_of([{"rule": "fee", "amount": 1}, {"rule": "markup", "percent": 10}])
+    assert markup_fee[("Canada", USPS_SVC_FCPIS, "weight_to_8oz")] == 12.00
+    assert fee_markup[("Canada", USPS_SVC_FCPIS, "weight_to_8oz")] == 12.10
+
+
+@pytest.mark.parametrize("match, changed", [
+    ({"price_groups": [15]}, {("Brazil", "weight_to_8oz"), ("Brazil", "weight_to_64oz")}),
+    ({"countries": ["Canada"]}, {("Canada", "weight_to_8oz"), ("Canada", "weight_to_64oz")}),
+    ({"bands": ["weight_to_64oz"]}, {("Brazil", "weight_to_64oz"), ("Canada", "weight_to_64oz")}),
+    ({"countries": ["Brazil"], "bands": ["weight_to_8oz"]}, {("Brazil", "weight_to_8oz")}),
+])
+def test_scoped_surcharge(match, changed):
+    policy, diff = reprice([{"rule": "surcharge", "amount": 3, **match}], MATRIX)
+    assert {(country, band) for country, service, band, *_ in diff} == changed
+    assert all(delta == 3 for *_, delta in diff)
+
+
+def test_surcharge_needs_match_keys():
+    with pytest.raises(ValueError):
+        compile_rules([{"rule": "surcharge", "amount": 3}])
+
+
+@pytest.mark.parametrize("rule, price, expected", [
+    ({"rule": "round", "ending": 0.99}, 17.85, 17.99),
+    ({"rule": "round", "ending": 0.99}, 18.00, 18.99),
+    # float noise: 18.99 - 0.99 is 17.999999999999996
+    ({"rule": "round", "ending": 0.99}, 18.99, 18.99),
+    ({"rule": "round", "ending": 0.99, "increment": 5}, 17.85, 20.99),
+    ({"rule": "round", "ending": 0.99, "increment": 5}, 15.99, 15.99),
+    ({"rule": "round", "increment": 5}, 17.85, 20.00),
+])
+def test_round(rule, price, expected):
+    matrix = [("Canada", USPS_SVC_FCPIS, 1, "weight_to_8oz", price)]
+    assert policy_of([rule], matrix)[("Canada", USPS_SVC_FCPIS, "weight_to_8oz")] == expected
+
+
+def test_round_ending_must_be_below_increment():
+    with pytest.raises(ValueError):
+        compile_rules([{"rule": "round", "ending": 1.5}])
+
+
+def test_reprice_diff():
+    policy, diff = reprice([{"rule": "fee", "amount": 2.5, "countries": ["Canada"]}], MATRIX)
+    assert len(policy) == len(MATRIX)
+    assert diff == [
+        ("Canada", USPS_SVC_FCPIS, "weight_to_8oz", 10.00, 12.50, 2.50),
+        ("Canada", USPS_SVC_FCPIS, "weight_to_64oz", 40.00, 42.50, 2.50),
+    ]
+    assert reprice([], MATRIX)[1] == []
+
+
+def test_reprice_db_matrix(db_path):
+    matrix = load_rate_matrix()
+    policy, diff = reprice([{"rule": "fee", "amount": 2, "countries": ["Brazil"]}], matrix)
+    assert len(policy) == len(matrix)
+    assert len(diff) == 4
+
+
+@pytest.mark.parametrize("rules", [
+    {"rule": "fee", "amount": 1},
+    ["fee"],
+    [{"rule": "discount", "amount": 1}],
+    [{"amount": 1}],
+    # misspelled match key must not turn into a global fee
+    [{"rule": "fee", "amount": 2, "country": ["Brazil"]}],
+    [{"rule": "markup", "percent": 5, "amount": 1}],
+    [{"rule": "fee"}],
+    [{"rule": "fee", "amount": "lots"}],
+    [{"rule": "fee", "amount": 1, "price_groups": ["fifteen"]}],
+    [{"rule": "fee", "amount": 1, "bands": ["weight_to_99oz"]}],
+    [{"rule": "fee", "amount": 1, "services": ["UPS"]}],
+])
+def test_invalid_rules_rejected(rules):
+    with pytest.raises(ValueError):
+        compile_rules(rules)
+
+
+@pytest.mark.parametrize("content", [{"rule": "fee", "amount": 1}, ["fee"]])
+def test_read_rules_rejects_non_list_of_objects(tmp_path, content):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(content))
+    with pytest.raises(ValueError):
+        read_rules(str(path))
@@ -0,0 +1,71 @@
+import pytest
+
+from discoship.cli import DiscoShipArgParser, delegate_args
+from discoship.db import create_profile_tables, execute, reset_config
+from discoship import profiles
+
+
+@pytest.fixture
+def shop(db_path):
+    create_profile_tables()
+    profiles.clear_config_cache()
+    profiles.create_profile("shopA")
+    return "shopA"
+
+
+def test_profile_config_overrides_global(shop):
+    assert profiles.get_config(shop)["usps_fcpis_cert_mailing_fee"] == 2.5
+    profiles.set_config(shop, "usps_fcpis_cert_mailing_fee", 3.0)
+    assert profiles.get_config(shop)["usps_fcpis_cert_mailing_fee"] == 3.0
+    profiles.unset_config(shop, "usps_fcpis_cert_mailing_fee")
+    assert profiles.get_config(shop)["usps_fcpis_cert_mailing_fee"] == 2.5
+
+
+def test_global_config_writes_invalidate_cache(shop):
+    assert profiles.get_config(shop)["usps_fcpis_cert_mailing_fee"] == 2.5
+    execute("UPDATE config SET value = 9 WHERE name = 'usps_fcpis_cert_mailing_fee'")
+    assert profiles.get_config(shop)["usps_fcpis_cert_mailing_fee"] == 9
+    reset_config()
+    assert profiles.get_config(shop)["usps_fcpis_cert_mailing_fee"] == 2.5
+
+
+def test_unknown_profile_raises(shop):
+    with pytest.raises(ValueError):
+        profiles.get_config("nope")
+    with pytest.raises(ValueError):
+        profiles.get_rules("nope")
+    with pytest.raises(SystemExit):
+        delegate_args(DiscoShipArgParser.parse_args(["config", "--dump", "--profile", "nope"]))
+
+
+def test_generate_policies_drops_stale_rows(shop):
+    profiles.set_rules(shop, [{"rule": "fee", "amount": 1}])
+    profiles.generate_policies([shop])
+    policy = profiles.dump_policy(shop)
+    assert ("Brazil", "weight_to_8oz") in policy
+
+    execute("DELETE FROM usps_cpg WHERE country_name = 'Brazil'")
+    counts = profiles.generate_policies([shop])
+    policy = profiles.dump_policy(shop)
+    assert ("Brazil", "weight_to_8oz") not in policy
+    assert counts[shop] == len(policy)
+
+
+
+def test_write_between_read_and_store_is_not_cached(shop, monkeypatch):
+    real_select = profiles.select
+    interleaved = []
+
+    def select_then_write(sql, params=None):
+        rows = real_select(sql, params)
+        if sql == profiles.SELECT_PROFILE_CONFIG and not interleaved:
+            interleaved.append(True)
+            # another thread's set_config commits after get_config read the
+            # profile's rows, but before it stores the merged result
+            profiles.set_config(shop, "usps_fcpis_cert_mailing_fee", 7.0)
+        return rows
+
+    monkeypatch.setattr(profiles, "select", select_then_write)
+    assert profiles.get_config(shop)["usps_fcpis_cert_mailing_fee"] == 2.5
+    assert interleaved
+    assert profiles.get_config(shop)["usps_fcpis_cert_mailing_fee"] == 7.0